@@ -1,16 +1,95 @@
 #!/usr/bin/python3
-from mpi4py import MPI
-from dolfinx.io import gmshio, XDMFFile
-from scipy.stats import truncnorm
+from scipy.special import ndtr, ndtri
+from numba import njit
+from contextlib import contextmanager
+import numpy as np
 import gmsh
-import random
 import math
 import json
 import os
 
+@njit(cache=True, fastmath=True)
+def _any_overlap(cxs, cys, rs, cx, cy, r):
+    for i in range(cxs.size):
+        dx = cxs[i] - cx
+        dy = cys[i] - cy
+        s = rs[i] + r
+        if dx * dx + dy * dy < s * s:
+            return True
+    return False
+
+
+@contextmanager
+def mesh_session():
+    gmsh.initialize()
+    num_threads = os.cpu_count() or 1
+    gmsh.option.setNumber("General.NumThreads", num_threads)
+    gmsh.option.setNumber("Mesh.MaxNumThreads2D", num_threads)
+    try:
+        yield
+    finally:
+        gmsh.finalize()
+
+
+class Quadtree:
+    def __init__(self, bbox, max_depth, split_threshold=8, depth=0):
+        self.bbox = bbox
+        self.max_depth = max_depth
+        self.split_threshold = split_threshold
+        self.depth = depth
+        self.children = None
+        self.items = []
+
+    def _intersects(self, x_min, y_min, x_max, y_max):
+        bx_min, by_min, bx_max, by_max = self.bbox
+        return x_min <= bx_max and x_max >= bx_min and y_min <= by_max and y_max >= by_min
+
+    def _split(self):
+        x_min, y_min, x_max, y_max = self.bbox
+        xm = 0.5 * (x_min + x_max)
+        ym = 0.5 * (y_min + y_max)
+        self.children = [
+            Quadtree(bbox, self.max_depth, self.split_threshold, self.depth + 1)
+            for bbox in (
+                (x_min, y_min, xm, ym),
+                (xm, y_min, x_max, ym),
+                (x_min, ym, xm, y_max),
+                (xm, ym, x_max, y_max),
+            )
+        ]
+        items, self.items = self.items, []
+        for item in items:
+            self.insert(item)
+
+    def insert(self, item):
+        cx, cy, r, _ = item
+        if not self._intersects(cx - r, cy - r, cx + r, cy + r):
+            return
+        if self.children is None:
+            self.items.append(item)
+            if len(self.items) > self.split_threshold and self.depth < self.max_depth:
+                self._split()
+            return
+        for child in self.children:
+            child.insert(item)
+
+    def query(self, cx, cy, r):
+        # Items spanning several leaves are yielded once per leaf; callers
+        # only run a cheap exact test on them, so duplicates are harmless.
+        if not self._intersects(cx - r, cy - r, cx + r, cy + r):
+            return
+        if self.children is None:
+            for item in self.items:
+                yield item[3]
+            return
+        for child in self.children:
+            yield from child.query(cx, cy, r)
+
+
 class MeshGenerator:
     def __init__(self, layout, size, circles, randomized_max_radius, distribution,
-                 set_circle_radius, mesh_element_size, randomized_radius, min_fraction_inside=0.3):
+                 set_circle_radius, mesh_element_size, randomized_radius, min_fraction_inside=0.3,
+                 seed=None):
         self.layout = layout
         self.layout_x = float(layout[0])
         self.layout_y = float(layout[1])
@@ -21,28 +100,122 @@ class MeshGenerator:
         self.set_circle_radius = set_circle_radius
         self.mesh_element_size = mesh_element_size
         self.randomized_radius = randomized_radius
-        self.placed_circles = []
         self.min_fraction_inside = min_fraction_inside
         self.circle_area_sum = 0.0
         self.square_area_sum = self.layout_x * self.layout_y
 
-    def check_circ_overlap(self, x1, y1, r1, x2, y2, r2) -> bool:
-        d = math.sqrt((x2 - x1)**2 + (y2 - y1)**2)
-        return d < (r1 + r2)
-
-    def is_enough_inside(self, cx, cy, radius):
-        x_min = cx - radius
-        x_max = cx + radius
-        y_min = cy - radius
-        y_max = cy + radius
-
-        x_overlap = max(0, min(x_max, self.layout_x) - max(x_min, 0))
-        y_overlap = max(0, min(y_max, self.layout_y) - max(y_min, 0))
-
-        overlap_area = x_overlap * y_overlap
-        circle_area = math.pi * radius * radius
+        max_radius = randomized_max_radius if randomized_radius else set_circle_radius
+        self._cell = 2 * max_radius
+        self._grid = {}
+        self._quadtree = None
+
+        # PCG64 generator; seed=None pulls fresh entropy from the OS.
+        self.rng = np.random.default_rng(seed)
+
+        # Truncated gaussian radius bounds are fixed for a generator, so the
+        # normal CDF at both ends is computed once and samples are drawn by
+        # inverting it in batches.
+        self._rmin = 0.1
+        self._rmax = randomized_max_radius
+        self._rmean = (randomized_max_radius + 0.1) / 2
+        self._rstd = (randomized_max_radius - 0.1) / 4
+        if randomized_radius and distribution == "gaussian":
+            self._phi_a = ndtr((self._rmin - self._rmean) / self._rstd)
+            self._phi_span = ndtr((self._rmax - self._rmean) / self._rstd) - self._phi_a
+        self._radius_batch = 1024
+        self._candidate_batch = 256
+        self._radius_buffer = np.empty(0)
+        self._radius_pos = 0
+
+        # Periodic image translations. Bits of the mask are set when a circle
+        # crosses the left, right, bottom and top edges respectively; each mask
+        # maps to the rows of _shifts whose images are needed. Images are
+        # written into the fixed _positions buffer to avoid allocating per
+        # candidate.
+        lx, ly = self.layout_x, self.layout_y
+        self._shifts = np.array([
+            [0, 0], [lx, 0], [-lx, 0], [0, ly], [0, -ly],
+            [lx, ly], [-lx, ly], [lx, -ly], [-lx, -ly],
+        ])
+        shift_masks = [0, 0b0001, 0b0010, 0b0100, 0b1000, 0b0101, 0b0110, 0b1001, 0b1010]
+        self._image_shifts = {
+            mask: self._shifts[[i for i, m in enumerate(shift_masks) if m & mask == m]]
+            for mask in range(16)
+        }
+        self._positions = np.empty((9, 2))
+
+        # Placed circles as parallel arrays; the spatial index stores row ids.
+        self._count = 0
+        self._cx = np.empty(64)
+        self._cy = np.empty(64)
+        self._r = np.empty(64)
+
+        # Compile the overlap kernel up front rather than on the first placement.
+        _any_overlap(self._cx[:0], self._cy[:0], self._r[:0], 0.0, 0.0, 0.0)
+
+        # Gaussian radii vary too much for a fixed cell size, so index them in
+        # a quadtree instead. Periodic images reach up to one diameter past the
+        # layout, hence the margin on the root box.
+        if randomized_radius and distribution == "gaussian":
+            margin = 2 * max_radius
+            max_depth = max(1, math.ceil(math.log2(max(self.layout_x, self.layout_y) / 0.1)))
+            self._quadtree = Quadtree(
+                (-margin, -margin, self.layout_x + margin, self.layout_y + margin), max_depth
+            )
 
-        return overlap_area / circle_area >= self.min_fraction_inside
+    def check_circ_overlap(self, x1, y1, r1, x2, y2, r2) -> bool:
+        return (x2 - x1) * (x2 - x1) + (y2 - y1) * (y2 - y1) < (r1 + r2) * (r1 + r2)
+
+    def _cell_key(self, x, y):
+        return math.floor(x / self._cell), math.floor(y / self._cell)
+
+    def _insert(self, cx, cy, radius):
+        n = self._count
+        if n == self._cx.size:
+            self._cx = np.resize(self._cx, 2 * n)
+            self._cy = np.resize(self._cy, 2 * n)
+            self._r = np.resize(self._r, 2 * n)
+        self._cx[n] = cx
+        self._cy[n] = cy
+        self._r[n] = radius
+        self._count = n + 1
+
+        if self._quadtree is not None:
+            self._quadtree.insert((cx, cy, radius, n))
+        else:
+            self._grid.setdefault(self._cell_key(cx, cy), []).append(n)
+
+    def _candidates(self, cx, cy, radius):
+        if self._quadtree is not None:
+            yield from self._quadtree.query(cx, cy, radius)
+            return
+        # Cells are at least one max diameter wide, so any overlapping circle
+        # has its center in the 3x3 block of cells around (cx, cy).
+        kx, ky = self._cell_key(cx, cy)
+        for i in range(kx - 1, kx + 2):
+            for j in range(ky - 1, ky + 2):
+                yield from self._grid.get((i, j), ())
+
+    def _batch_check(self, cxs, cys, radius):
+        ids = set()
+        for px, py in zip(cxs, cys):
+            ids.update(self._candidates(px, py, radius))
+        if not ids:
+            return False
+
+        ids = np.fromiter(ids, dtype=np.intp, count=len(ids))
+        near_x = self._cx[ids]
+        near_y = self._cy[ids]
+        near_r = self._r[ids]
+        for px, py in zip(cxs, cys):
+            if _any_overlap(near_x, near_y, near_r, px, py, radius):
+                return True
+        return False
+
+    def _touches_layout(self, cx, cy, radius):
+        dx = cx - min(max(cx, 0.0), self.layout_x)
+        dy = cy - min(max(cy, 0.0), self.layout_y)
+        return dx * dx + dy * dy < radius * radius
 
     def create_rect(self):
         rect = gmsh.model.occ.addRectangle(0, 0, 0, self.layout_x, self.layout_y)
@@ -53,109 +226,117 @@ class MeshGenerator:
     def add_circle(self, cx, cy, radius):
         return gmsh.model.occ.addDisk(cx, cy, 0, radius, radius)
 
-    def truncated_gaussian(self, rmin, rmax, rmean, rstd):
-        a, b = (rmin - rmean) / rstd, (rmax - rmean) / rstd
-        return truncnorm.rvs(a, b, loc=rmean, scale=rstd)
+    def truncated_gaussian(self, size):
+        if self._radius_pos + size > self._radius_buffer.size:
+            u = self._phi_a + self._phi_span * self.rng.random(max(size, self._radius_batch))
+            self._radius_buffer = np.clip(self._rmean + self._rstd * ndtri(u), self._rmin, self._rmax)
+            self._radius_pos = 0
+        radii = self._radius_buffer[self._radius_pos:self._radius_pos + size]
+        self._radius_pos += size
+        return radii
+
+    def _draw_radii(self, size):
+        if not self.randomized_radius:
+            return np.full(size, float(self.set_circle_radius))
+        if self.distribution == "uniform":
+            return self.rng.uniform(0.1, self.randomized_max_radius, size)
+        if self.distribution == "gaussian":
+            return self.truncated_gaussian(size)
+        raise ValueError("Unsupported distribution type.")
+
+    def _next_placement(self):
+        # Candidates are drawn and pre-filtered in batches; survivors are then
+        # checked against the spatial index in draw order, so the first valid
+        # one is taken exactly as if they had been drawn one at a time.
+        n = self._candidate_batch
+        while True:
+            radii = self._draw_radii(n)
+            cxs = self.rng.uniform(-radii, self.layout_x + radii)
+            cys = self.rng.uniform(-radii, self.layout_y + radii)
+
+            masks = (
+                (cxs - radii < 0).astype(np.intp)
+                | ((cxs + radii > self.layout_x) << 1)
+                | ((cys - radii < 0) << 2)
+                | ((cys + radii > self.layout_y) << 3)
+            )
+            x_overlap = np.maximum(0, np.minimum(cxs + radii, self.layout_x) - np.maximum(cxs - radii, 0))
+            y_overlap = np.maximum(0, np.minimum(cys + radii, self.layout_y) - np.maximum(cys - radii, 0))
+            min_area = self.min_fraction_inside * math.pi * radii * radii
+            inside = x_overlap * y_overlap >= min_area
+
+            for i in np.flatnonzero(inside):
+                cx, cy, radius = cxs[i], cys[i], radii[i]
+                shifts = self._image_shifts[masks[i]]
+                positions = self._positions[:len(shifts)]
+                positions[:] = shifts
+                positions[:, 0] += cx
+                positions[:, 1] += cy
+                if not self._batch_check(positions[:, 0], positions[:, 1], radius):
+                    # positions views the shared _positions buffer; use it before the next placement is drawn.
+                    return cx, cy, radius, positions
 
     def generate(self, visualize=True, save_path=None):
-        comm = MPI.COMM_WORLD
-        rank = comm.rank
+        assert save_path is not None, "save_path is required to write the mesh"
+
+        # Callers generating many meshes should hold a mesh_session() open so
+        # gmsh is only initialized once; otherwise use a session of our own.
+        if not gmsh.isInitialized():
+            with mesh_session():
+                return self.generate(visualize=visualize, save_path=save_path)
 
-        gmsh.initialize()
         gmsh.model.add("Mesh Result")
+        try:
+            self._build()
+            self._write(save_path)
+
+            if visualize:
+                try:
+                    gmsh.fltk.run()
+                except Exception as e:
+                    pass
+        finally:
+            gmsh.model.remove()
+
+    def _build(self):
         gmsh.option.setNumber("Mesh.CharacteristicLengthMax", self.mesh_element_size)
 
         rect, rect_edges = self.create_rect()
         circle_tags = []
 
+        # Every image stays in the spatial index for overlap checks, but only
+        # disks that reach into the layout are handed to gmsh.
         placed_count = 0
         while placed_count < self.circles:
-            valid_placement = False
-            while not valid_placement:
-                if self.randomized_radius:
-                    if self.distribution == "uniform":
-                        circle_radius = random.uniform(0.1, self.randomized_max_radius)
-                    elif self.distribution == "gaussian":
-                        circle_radius = self.truncated_gaussian(
-                            rmin=0.1,
-                            rmax=self.randomized_max_radius,
-                            rmean=(self.randomized_max_radius + 0.1) / 2,
-                            rstd=(self.randomized_max_radius - 0.1) / 4
-                        )
-                    else:
-                        raise ValueError("Unsupported distribution type.")
-                else:
-                    circle_radius = self.set_circle_radius
-
-                cx = random.uniform(-circle_radius, self.layout_x + circle_radius)
-                cy = random.uniform(-circle_radius, self.layout_y + circle_radius)
-
-                potential_positions = [(cx, cy)]
-
-                if cx - circle_radius < 0:
-                    potential_positions.append((cx + self.layout_x, cy))
-                if cx + circle_radius > self.layout_x:
-                    potential_positions.append((cx - self.layout_x, cy))
-                if cy - circle_radius < 0:
-                    potential_positions.append((cx, cy + self.layout_y))
-                if cy + circle_radius > self.layout_y:
-                    potential_positions.append((cx, cy - self.layout_y))
-
-                if cx - circle_radius < 0 and cy - circle_radius < 0:
-                    potential_positions.append((cx + self.layout_x, cy + self.layout_y))
-                if cx + circle_radius > self.layout_x and cy - circle_radius < 0:
-                    potential_positions.append((cx - self.layout_x, cy + self.layout_y))
-                if cx - circle_radius < 0 and cy + circle_radius > self.layout_y:
-                    potential_positions.append((cx + self.layout_x, cy - self.layout_y))
-                if cx + circle_radius > self.layout_x and cy + circle_radius > self.layout_y:
-                    potential_positions.append((cx - self.layout_x, cy - self.layout_y))
-
-                valid_placement = all(
-                    not self.check_circ_overlap(px, py, circle_radius, x, y, r)
-                    for px, py in potential_positions
-                    for x, y, r in self.placed_circles
-                ) and self.is_enough_inside(cx, cy, circle_radius)
+            cx, cy, circle_radius, positions = self._next_placement()
 
             placed_count += 1
-            self.placed_circles.append((cx, cy, circle_radius))
-            circle_tags.append(self.add_circle(cx, cy, circle_radius))
-
-            for px, py in potential_positions[1:]:
-                self.placed_circles.append((px, py, circle_radius))
+            for px, py in positions:
+                self._insert(px, py, circle_radius)
+                if not self._touches_layout(px, py, circle_radius):
+                    continue
                 circle_tags.append(self.add_circle(px, py, circle_radius))
 
         gmsh.model.occ.synchronize()
 
-        valid_circle_tags = []
-        for tag in circle_tags:
-            try:
-                gmsh.model.occ.getCenterOfMass(2, tag)
-                valid_circle_tags.append(tag)
-            except:
-                pass
+        existing = {tag for _, tag in gmsh.model.getEntities(2)}
+        valid_circle_tags = [tag for tag in circle_tags if tag in existing]
 
         gmsh.model.occ.fragment([(2, rect)], [(2, tag) for tag in valid_circle_tags])
         gmsh.model.occ.synchronize()
 
-        all_edges = gmsh.model.getEntities(dim=1)
+        tol = 1e-6
+        lx, ly = self.layout_x, self.layout_y
 
-        def midpoint(tag):
-            x, y, _ = gmsh.model.occ.getCenterOfMass(1, tag)
-            return x, y
+        def edges_in_box(x_min, y_min, x_max, y_max):
+            return [tag for _, tag in gmsh.model.getEntitiesInBoundingBox(
+                x_min - tol, y_min - tol, -tol, x_max + tol, y_max + tol, tol, dim=1
+            )]
 
-        tol = 1e-6
-        left, right, bottom, top = [], [], [], []
-
-        for (dim, tag) in all_edges:
-            x, y = midpoint(tag)
-            if abs(x - 0) < tol:
-                left.append(tag)
-            elif abs(x - self.layout_x) < tol:
-                right.append(tag)
-            elif abs(y - 0) < tol:
-                bottom.append(tag)
-            elif abs(y - self.layout_y) < tol:
-                top.append(tag)
+        left = edges_in_box(0, 0, 0, ly)
+        right = edges_in_box(lx, 0, lx, ly)
+        bottom = edges_in_box(0, 0, lx, 0)
+        top = edges_in_box(0, ly, lx, ly)
 
         gmsh.model.addPhysicalGroup(1, bottom, tag=1)
         gmsh.model.setPhysicalName(1, 1, "Bottom")
@@ -177,6 +358,15 @@ class MeshGenerator:
 
         gmsh.model.mesh.generate(2)
 
+    def _write(self, save_path):
+        # dolfinx and MPI are only needed to write the mesh; importing them
+        # here keeps the placement code cheap to import.
+        from mpi4py import MPI
+        from dolfinx.io import gmshio, XDMFFile
+
+        comm = MPI.COMM_WORLD
+        rank = comm.rank
+
         mesh, cell_tags, facet_tags, *rest = gmshio.model_to_mesh(gmsh.model, comm, 0, gdim=2)
         mesh.topology.create_entities(mesh.topology.dim - 1)
         mesh.topology.create_connectivity(mesh.topology.dim - 1, mesh.topology.dim)
@@ -189,24 +379,19 @@ class MeshGenerator:
             xdmf.write_meshtags(cell_tags)
             xdmf.write_meshtags(facet_tags)
 
-        self.circle_area_sum = sum(math.pi * r * r for _, _, r in self.placed_circles)
+        placed_r = self._r[:self._count]
+        self.circle_area_sum = float(np.sum(math.pi * placed_r * placed_r))
         distribution = (self.circle_area_sum / self.square_area_sum) * 100
 
-        data = {
-            "id": rank,
-            "circles": self.circles,
-            "distribution": distribution
-        }
-
-        save_dir = os.path.dirname(save_path)
-        json_path = os.path.join(save_dir, "meshinfo.json")
-
-        json.dump(data, open(json_path, "w"))
-
-        if visualize:
-            try:
-                gmsh.fltk.run()
-            except Exception as e:
-                pass
-
-        gmsh.finalize()
\ No newline at end of file
+        # XDMFFile is collective, but meshinfo.json is a single small file
+        # and only needs one writer.
+        if rank == 0:
+            data = {
+                "id": rank,
+                "circles": self.circles,
+                "distribution": distribution
+            }
+
+            json_path = os.path.join(os.path.dirname(save_path), "meshinfo.json")
+            with open(json_path, "w") as json_file:
+                json.dump(data, json_file)
@@ -37,50 +37,52 @@ def genmeshes():
     elif model == "histogram":
         arg = "-b"
 
-    for i in range(fields["cycles"]):
-        if not os.path.exists(RECORDS_PATH):
-            os.mkdir(RECORDS_PATH)
-        path_name = RECORDS_PATH + "/" + str(i)
-        if os.path.exists(path_name):
-            os.system("rm -rf " + path_name)
-        os.mkdir(path_name)
-        mesh_save_path = path_name + "/mesh" + str(i) + ".xdmf"
-        print("Generating mesh " + str(i) + " stored at " + mesh_save_path)
+    with armgen2d.mesh_session():
+        for i in range(fields["cycles"]):
+            if not os.path.exists(RECORDS_PATH):
+                os.mkdir(RECORDS_PATH)
+            path_name = RECORDS_PATH + "/" + str(i)
+            if os.path.exists(path_name):
+                os.system("rm -rf " + path_name)
+            os.mkdir(path_name)
+            mesh_save_path = path_name + "/mesh" + str(i) + ".xdmf"
+            print("Generating mesh " + str(i) + " stored at " + mesh_save_path)
 
-        generator = armgen2d.MeshGenerator(
-            layout=fields["layout"],
-            size=fields["size"],
-            mesh_element_size=fields["mesh_element_size"],
-            circles=fields["circles"] if not fields["ramp_circles"] else ramp_circle_value,
-            randomized_max_radius=fields["randomized_max_radius"],
-            distribution=fields["distribution"],
-            set_circle_radius=fields["set_circle_radius"],
-            randomized_radius=fields["randomized_radius"],
-            min_fraction_inside=fields["min_fraction_inside"],
-        )
-        generator.generate(save_path=mesh_save_path, visualize=False)
-
-        analysis_path = os.path.join(SCRIPT_PATH, "analysis.py")
-        model_path = os.path.join(SCRIPT_PATH, "model.py")
-        try:
-            create_files = "0"
-            if fields["create_mesh_files"]:
-                create_files = "1"
-            subprocess.run(
-                [
-                    "mpirun", "-np", "1", "python3", 
-                    analysis_path, mesh_save_path, 
-                    RESULTS_PATH, 
-                    os.path.join(SCRIPT_PATH, "input.json"), 
-                    create_files
-                ],
-                cwd=path_name,
-                check=True
+            generator = armgen2d.MeshGenerator(
+                layout=fields["layout"],
+                size=fields["size"],
+                mesh_element_size=fields["mesh_element_size"],
+                circles=fields["circles"] if not fields["ramp_circles"] else ramp_circle_value,
+                randomized_max_radius=fields["randomized_max_radius"],
+                distribution=fields["distribution"],
+                set_circle_radius=fields["set_circle_radius"],
+                randomized_radius=fields["randomized_radius"],
+                min_fraction_inside=fields["min_fraction_inside"],
+                seed=None if fields.get("seed") is None else [fields["seed"], i],
             )
-            print(f"Analysis complete for mesh {i}")
-        except subprocess.CalledProcessError as e:
-            print(f"Analysis failed for mesh {i}: {e}")
-        ramp_circle_value += fields["ramp_circles_params"]["step"]
+            generator.generate(save_path=mesh_save_path, visualize=False)
+
+            analysis_path = os.path.join(SCRIPT_PATH, "analysis.py")
+            model_path = os.path.join(SCRIPT_PATH, "model.py")
+            try:
+                create_files = "0"
+                if fields["create_mesh_files"]:
+                    create_files = "1"
+                subprocess.run(
+                    [
+                        "mpirun", "-np", "1", "python3", 
+                        analysis_path, mesh_save_path, 
+                        RESULTS_PATH, 
+                        os.path.join(SCRIPT_PATH, "input.json"), 
+                        create_files
+                    ],
+                    cwd=path_name,
+                    check=True
+                )
+                print(f"Analysis complete for mesh {i}")
+            except subprocess.CalledProcessError as e:
+                print(f"Analysis failed for mesh {i}: {e}")
+            ramp_circle_value += fields["ramp_circles_params"]["step"]
         
     try:
         subprocess.run(
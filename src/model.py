@@ -1,79 +1,90 @@
-import matplotlib.pyplot as plt
+import matplotlib
 import numpy as np
 import os
 import sys
-import csv
+
+# Without a display there is nothing to show, so render straight to Agg and
+# skip pyplot's GUI machinery entirely.
+HEADLESS = not os.environ.get("DISPLAY")
+if HEADLESS:
+    matplotlib.use("Agg")
+else:
+    import matplotlib.pyplot as plt
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 
 results_path = sys.argv[2] if len(sys.argv) > 1 else "results"
 results_file = os.path.join(results_path, "data.csv")
 
+def load_fields(x_field, y_field):
+    data = np.atleast_1d(np.genfromtxt(results_file, delimiter=',', names=True, dtype=float, invalid_raise=False))
+    x_data = data[x_field]
+    y_data = data[y_field]
+
+    valid = ~(np.isnan(x_data) | np.isnan(y_data))
+    skipped = np.count_nonzero(~valid)
+    if skipped:
+        print(f"Skipping {skipped} rows with invalid data")
+    return x_data[valid], y_data[valid]
+
+def new_figure():
+    if HEADLESS:
+        return Figure(figsize=(8, 5))
+    return plt.figure(figsize=(8, 5))
+
+def save_figure(fig, save_path):
+    if HEADLESS:
+        FigureCanvasAgg(fig).print_png(save_path)
+    else:
+        fig.savefig(save_path)
+
 def generate_matplot(x_field, y_field):
-    x_data = []
-    y_data = []
-
-    with open(results_file, mode='r') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            try:
-                x_data.append(float(row[x_field]))
-                y_data.append(float(row[y_field]))
-            except ValueError:
-                print(f"Skipping row with invalid data: {row}")
-
-    plt.figure(figsize=(8, 5))
-    plt.plot(x_data, y_data, marker='o', linestyle='-')
-    plt.xlabel(x_field)
-    plt.ylabel(y_field)
-    plt.title(f'{y_field} vs {x_field}')
-    plt.grid(True)
-    plt.tight_layout()
+    x_data, y_data = load_fields(x_field, y_field)
+
+    fig = new_figure()
+    ax = fig.add_subplot()
+    ax.plot(x_data, y_data, marker='o', linestyle='-')
+    ax.set_xlabel(x_field)
+    ax.set_ylabel(y_field)
+    ax.set_title(f'{y_field} vs {x_field}')
+    ax.grid(True)
+    fig.tight_layout()
 
     filename = f"{x_field}_{y_field}_mat.png"
     save_path = os.path.join(results_path, filename)
-    plt.savefig(save_path)
+    save_figure(fig, save_path)
     print(f"Plot saved to: {save_path}")
 
-    plt.show()
+    if not HEADLESS:
+        plt.show()
 
 def generate_binned_histogram(x_field, y_field, bins=10):
-    x_data = []
-    y_data = []
-
-    with open(results_file, mode='r') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            try:
-                x_data.append(float(row[x_field]))
-                y_data.append(float(row[y_field]))
-            except ValueError:
-                print(f"Skipping invalid row: {row}")
-
-    bin_sums = np.zeros(bins)
-    bin_counts = np.zeros(bins)
-    bin_edges = np.linspace(min(x_data), max(x_data), bins + 1)
-
-    for x, y in zip(x_data, y_data):
-        bin_index = np.digitize(x, bin_edges) - 1
-        if 0 <= bin_index < bins:
-            bin_sums[bin_index] += y
-            bin_counts[bin_index] += 1
+    x_data, y_data = load_fields(x_field, y_field)
+
+    bin_edges = np.linspace(x_data.min(), x_data.max(), bins + 1)
+    bin_sums, _ = np.histogram(x_data, bins=bin_edges, weights=y_data)
+    bin_counts, _ = np.histogram(x_data, bins=bin_edges)
 
     bin_means = bin_sums / np.maximum(bin_counts, 1)
     bin_centers = 0.5 * (bin_edges[:-1] + bin_edges[1:])
 
     # Plot
-    plt.figure(figsize=(8, 5))
-    plt.bar(bin_centers, bin_means, width=(bin_edges[1] - bin_edges[0]), align='center', edgecolor='black')
-    plt.xlabel(x_field)
-    plt.ylabel(f"Mean {y_field}")
-    plt.title(f"{y_field} binned by {x_field}")
-    plt.tight_layout()
+    fig = new_figure()
+    ax = fig.add_subplot()
+    ax.bar(bin_centers, bin_means, width=(bin_edges[1] - bin_edges[0]), align='center', edgecolor='black')
+    ax.set_xlabel(x_field)
+    ax.set_ylabel(f"Mean {y_field}")
+    ax.set_title(f"{y_field} binned by {x_field}")
+    fig.tight_layout()
 
     filename = f"{x_field}_vs_{y_field}_binned.png"
     save_path = os.path.join(results_path, filename)
-    plt.savefig(save_path)
+    save_figure(fig, save_path)
     print(f"Binned histogram saved to: {save_path}")
-    plt.show()
+
+    if not HEADLESS:
+        plt.show()
 
 
 def controller():